@@ -5,14 +5,36 @@ import json
 import time
 # import toml
 import shutil
-from datetime import datetime
-from jsonschema import validate
-from jsonschema.exceptions import ValidationError
+import hashlib
+import sqlite3
+from itertools import chain
+from contextlib import closing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, Callable
+import orjson
+import fastjsonschema
+from fastjsonschema import JsonSchemaValueException
 
 # 2 Tables implementation: cards & users
 
 CWD = os.getcwd()  # current working directory
 replace_missing_data = True  # Whether to replace missing fields with blanks/NULLs or to discard the data
+batch_size = 1000  # number of rows to buffer before writing them to the CSV file
+write_buffer_size = 1 << 20  # output CSV file buffer size in bytes (1 MiB)
+log_file_name = 'errors.log'  # schema error log
+log_open_retries = 5  # attempts at opening the error log before giving up
+log_time = ''  # formatted time of the latest error log entry, see get_log_time()
+log_time_second = None  # the second `log_time` was formatted for
+validation_cache_file = '.validation_cache.sqlite'  # validation results of previous runs, to skip re-validating unchanged files
+cache_batch_size = 1000  # number of validation results to buffer before saving them to the cache
+read_chunk_size = 1 << 16  # bytes requested per read() call; most data files fit in one
+worker_batch_size = 64  # number of data files handed to a worker process at a time
+reader_threads = 8  # file reading threads per worker process
+validator = None  # schema validation function of the current worker process, set by init_worker()
+required_fields = None  # required fields of the current worker process's schema, set by init_worker()
+fieldnames = None  # CSV header fields of the current worker process, set by init_worker()
+is_users = False  # whether the current worker process handles "users" data, set by init_worker()
+reader = None  # file reading thread pool of the current worker process, set by init_worker()
 
 data = {
     "users": {
@@ -32,10 +54,14 @@ data = {
 
 
 def copy_file(fn: str, src: str, dst_dir: str) -> None:
-    if not os.path.isdir(dst_dir):
-        create_dir(dst_dir)
     dst = os.path.join(CWD, dst_dir, fn)
-    shutil.copy(src, dst)
+    try:
+        os.link(src, dst)  # hard link, no data is copied
+    except FileExistsError:  # copied on a previous run
+        if not os.path.samefile(src, dst):
+            shutil.copyfile(src, dst)
+    except OSError:  # e.g. destination is on another file system
+        shutil.copyfile(src, dst)
 
 
 def create_dir(dir_name: str) -> None:
@@ -45,26 +71,69 @@ def create_dir(dir_name: str) -> None:
         pass
 
 
-def save_log(file_name: str, content: str) -> None:
-
-    while True:
+def open_log(file_name: str) -> BinaryIO:
+    # retry with a growing delay, e.g. while another process holds the file
+    for attempt in range(1, log_open_retries + 1):
         try:
-            with open(file_name, "a", encoding="utf-8") as output_file:
-                output_file.write(content + "\n")
-                break
-        except (IOError, PermissionError) as error:
-            continue
+            return open(file_name, 'ab')
+        except OSError:
+            if attempt == log_open_retries:
+                raise
+            time.sleep(0.01 * attempt)
+
 
+def save_log(log_file: BinaryIO, content: str) -> None:
+    log_file.write(f'{content}\n'.encode('utf-8'))
 
-def validate_json(json_data: dict, schema: dict) -> tuple[bool, str]:
 
-    try:  # try to validate the JSON against schema
-        validate(instance=json_data, schema=schema)
+def validate_json(json_data: dict, validator: Callable[[dict], dict]) -> tuple[bool, str]:
+
+    try:
+        validator(json_data)
         return True, 'success'
-    except ValidationError as e:
+    except JsonSchemaValueException as e:
+        if e.rule == 'required':  # report missing fields the way jsonschema did, so they can still be told apart
+            missing = next(k for k in e.rule_definition if k not in e.value)
+            return False, f'{missing!r} is a required property'
+        if e.rule == 'type':  # likewise for type errors, so the error log reads the same
+            types = e.rule_definition if isinstance(e.rule_definition, list) else [e.rule_definition]
+            return False, f"{e.value!r} is not of type {', '.join(repr(t) for t in types)}"
         return False, e.message
 
 
+def get_required_fields(schema: dict) -> tuple[tuple, tuple]:
+    # required top-level fields & (section, required fields) pairs, in schema order
+    properties = schema['properties']
+    return (
+        tuple(schema['required']),
+        tuple((section, tuple(properties[section]['required'])) for section in properties),
+    )
+
+
+def find_shallow_error(json_data: dict, required_fields: tuple[tuple, tuple]) -> str | None:
+    # quick check for the schema errors nearest the top of the data, which jsonschema reported
+    # ahead of any field's error; returns the error message, or None to leave it to the validator
+    if not isinstance(json_data, dict):  # leave type errors to the validator
+        return None
+
+    top_level_fields, sections = required_fields
+    for field in top_level_fields:
+        if field not in json_data:
+            return f'{field!r} is a required property'
+
+    # like jsonschema, a section of the wrong type outranks missing fields in other sections
+    for section, fields in sections:
+        if not isinstance(json_data[section], dict):  # payload & metadata are objects in every schema
+            return f"{json_data[section]!r} is not of type 'object'"
+
+    for section, fields in sections:
+        for field in fields:
+            if field not in json_data[section]:
+                return f'{field!r} is a required property'
+
+    return None
+
+
 def format_time(seconds: float) -> str:
     if seconds is not None:
         seconds = int(seconds)
@@ -97,104 +166,238 @@ def get_field_names(schema: dict) -> tuple[list, list]:
     return fieldnames
 
 
-def get_row_data(json_data: dict) -> dict:
+def get_row_data(json_data: dict, fieldnames: list, is_users: bool) -> list:
     # retrieve JSON fields for CSV row
-    payload = json_data['payload'].items()  # Note: passed by reference
-    metadata = json_data['metadata'].items() # Note: passed by reference
-
-    row_dict = dict()
-    row_dict.update(payload)
-    row_dict.update(metadata)
+    row_dict = {**json_data['payload'], **json_data['metadata']}
 
     # adhoc data fix for "users"
-    if 'address' in row_dict.keys(): # check if is "users" data to prevent unnecessary overhead for "cards" data
-        row_dict['address'] = row_dict['address'].replace('\n', ' ')  # strip '\n' (newline character) from address feild
-        if ',' in row_dict['job']:  # check if is affected data
-            row_dict['job'] = fix_job_field(row_dict['job'])
+    if is_users:  # skip for "cards" data to prevent unnecessary overhead
+        # fields may be missing, or of the wrong type, in invalid data
+        address = row_dict.get('address')
+        if isinstance(address, str):
+            row_dict['address'] = address.replace('\n', ' ')  # strip '\n' (newline character) from address feild
+        job = row_dict.get('job')
+        if isinstance(job, str) and ',' in job:  # check if is affected data
+            row_dict['job'] = fix_job_field(job)
 
-    return row_dict
+    # order values by header field; missing fields are left blank & extra fields are dropped
+    return [row_dict.get(f, '') for f in fieldnames]
 
 
 def fix_job_field(job: str) -> str:
-    general_job_title, specialization = job.split(',')
+    comma_index = job.find(',')
+    general_job_title = job[:comma_index]
+    specialization = job[comma_index + 1:].lstrip()  # strip whitespace from specialization
 
-    specialization = specialization.lstrip()  # strip whitespace from specialization
     new_job_title = f'{specialization} {general_job_title}'.capitalize()  # create new title & capitalize
 
     return new_job_title
 
 
+def get_log_time() -> str:
+    # timestamps only show whole seconds, so format at most once per second
+    global log_time, log_time_second
+    now = int(time.time())
+    if now != log_time_second:
+        log_time = time.strftime("%d/%m/%Y %I:%M:%S %p", time.localtime(now))
+        log_time_second = now
+    return log_time
+
+
 def get_error_log(file_name: str, err_message: str) -> str:
-    time_ = datetime.now().strftime("%d/%m/%Y %I:%M:%S %p")
+    time_ = get_log_time()
     error = f'{time_}, ERROR, SCHEMA ERR, {file_name}, {err_message}'
     return error
 
 
-def main() -> None:
-    print('Running...')
-    start_time = time.perf_counter()
+def open_validation_cache(cache_file: str) -> sqlite3.Connection:
+    cache = sqlite3.connect(cache_file)
+    cache.execute(
+        'CREATE TABLE IF NOT EXISTS validation ('
+        'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, schema_key TEXT, is_valid INTEGER, message TEXT)'
+    )
+    return cache
+
+
+def get_schema_key(schema: dict) -> str:
+    # hash of the schema's canonical JSON form; a schema change invalidates previously cached results
+    return hashlib.blake2b(orjson.dumps(schema, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def load_validation_cache(cache: sqlite3.Connection, schema_key: str) -> dict:
+    # map each cached file path to its (mtime_ns, size, is_valid, message) record
+    rows = cache.execute('SELECT path, mtime_ns, size, is_valid, message FROM validation WHERE schema_key = ?', (schema_key,))
+    return {path: record for path, *record in rows}
+
+
+def get_cached_result(cached: dict, path: str, stat: os.stat_result) -> tuple[bool, str] | None:
+    # return the cached validation result if the file hasn't changed since it was validated
+    record = cached.get(path)
+    if record is None:
+        return None
+    mtime_ns, size, is_valid, message = record
+    if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+        return None
+    return bool(is_valid), message
 
-    for k, v in data.items():
-        print(f'\nProcessing {k}\'s data...')
-        output_file = v['output_file']
-        schema_file = v['schema_file']
-        data_dir = v['data_dir']
-        bad_data_dir = os.path.join(CWD, v['schema_mismatch_dir'])
 
-        # print(schema_file)
+def save_validation_results(cache: sqlite3.Connection, records: list) -> None:
+    cache.executemany('INSERT OR REPLACE INTO validation VALUES (?, ?, ?, ?, ?, ?)', records)
+    cache.commit()
 
-        file_count = 0  # total JSON data files
-        valid_count = 0  # files that match the schema spec
-        invalid_count = 0  # files that don't match the schema spec
 
-        data_path = os.path.join(CWD, data_dir)
-        path, dir_names, file_names = next(os.walk(data_path))
+def init_worker(schema: dict, users_data: bool) -> None:
+    # compile the schema once per worker process; compiled validators can't be pickled
+    # formats (date-time, uuid) are not asserted, matching the previous jsonschema behaviour
+    global validator, required_fields, fieldnames, is_users, reader
+    validator = fastjsonschema.compile(schema, use_formats=False)
+    required_fields = get_required_fields(schema)
+    fieldnames = get_field_names(schema)
+    is_users = users_data
+    reader = ThreadPoolExecutor(max_workers=reader_threads)  # file reads release the GIL
 
-        with open(schema_file, 'r') as schema_s:
-            schema = json.load(schema_s)
 
-        with open(output_file, 'a', newline='') as csv_file:
-            fieldnames = get_field_names(schema)
-            # create CSV writer object
-            csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames, restval='', extrasaction='ignore')
-            # write header row
-            csv_writer.writeheader()
+def read_file(file_path: str) -> bytes:
+    # raw os-level reads skip the fstat/ioctl/lseek calls a buffered file object makes on open
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        chunks = []
+        while chunk := os.read(fd, read_chunk_size):
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return b''.join(chunks)
+
+
+def keep_row(is_valid: bool, message: str) -> bool:
+    # whether a file's data goes to the CSV file, given its validation result
+    if is_valid:
+        return True
+
+    if 'is a required property' not in message:  # if error is anything other than missing field/property
+        return False
 
-            for file_name in file_names:
-                if file_name.endswith('.json'):  # parse JSON files only
-                    file_count += 1  # increment JSON file count
-                else:
-                    continue
+    return replace_missing_data  # replace missing fields or discard invalid data
 
-                json_file_path = os.path.join(data_path, file_name)
 
-                with open(json_file_path, 'r') as json_file:
-                    json_data = json.load(json_file)
+def process_file(pending_read: Future | None, cached_result: tuple[bool, str] | None) -> tuple[bool, str, list | None]:
+    # validate & build the CSV row for one data file, from its read on the reader threads
+    if cached_result is None:
+        json_data = orjson.loads(pending_read.result())  # orjson parses bytes directly, no text decoding needed
+        error = find_shallow_error(json_data, required_fields)
+        if error is not None:  # no need for full validation
+            is_valid, message = False, error
+        else:
+            is_valid, message = validate_json(json_data=json_data, validator=validator)
+    else:  # file is unchanged since it was last validated
+        json_data = None
+        is_valid, message = cached_result
 
-                is_valid, message = validate_json(json_data=json_data, schema=schema)
+    if not keep_row(is_valid, message):
+        return is_valid, message, None
 
-                if not is_valid:
+    if json_data is None:  # only read for its row data
+        json_data = orjson.loads(pending_read.result())
 
-                    invalid_count += 1
-                    error = get_error_log(json_file_path, message)
-                    save_log('errors.log', error)  # log error to file for later inspection
-                    copy_file(file_name, json_file_path, bad_data_dir)  # copy the file to another directory for later inspection
+    return is_valid, message, get_row_data(json_data, fieldnames, is_users)
 
-                    if 'is a required property' not in message:  # if error is anything other than missing field/property
-                        continue  # continue to next data
 
-                    if not replace_missing_data:  # discard invalid data
-                        continue  # continue to next data
-                else:
-                    valid_count += 1
+def process_files(json_file_paths: list, cached_results: list) -> list:
+    # runs in a worker process; reads are queued up front on the reader threads,
+    # so later files are read while earlier ones are parsed & validated
+    pending_reads = [
+        reader.submit(read_file, json_file_path) if cached_result is None or keep_row(*cached_result) else None
+        for json_file_path, cached_result in zip(json_file_paths, cached_results)
+    ]
+    return [process_file(*args) for args in zip(pending_reads, cached_results)]
 
-                row_dict = get_row_data(json_data)
-                # print(row_dict)
-                csv_writer.writerow(row_dict)
 
-        print(f'Total JSON data files for "{k}": {file_count}')
-        print(f'Number of files that match schema: {valid_count}')
-        print(f'Number of files with schema errors: {invalid_count}\n')
+def main() -> None:
+    print('Running...')
+    start_time = time.perf_counter()
+
+    # keep the cache & error log open for the whole run; closed even if a table fails
+    with (
+        closing(open_validation_cache(validation_cache_file)) as cache,
+        open_log(log_file_name) as log_file,
+    ):
+        for k, v in data.items():
+            print(f'\nProcessing {k}\'s data...')
+            output_file = v['output_file']
+            schema_file = v['schema_file']
+            data_dir = v['data_dir']
+            bad_data_dir = os.path.join(CWD, v['schema_mismatch_dir'])
+
+            # print(schema_file)
+
+            valid_count = 0  # files that match the schema spec
+            invalid_count = 0  # files that don't match the schema spec
+
+            data_path = os.path.join(CWD, data_dir)
+            with os.scandir(data_path) as it:  # parse JSON files only
+                entries = [e for e in it if e.is_file() and e.name.endswith('.json')]
+            # taken before any file is read, so a cached result always matches the data it was validated on
+            stats = [e.stat() for e in entries]
+
+            with open(schema_file, 'r') as schema_s:
+                schema = json.load(schema_s)
+
+            # look up files validated against this schema on a previous run
+            schema_key = get_schema_key(schema)
+            cached = load_validation_cache(cache, schema_key)
+            cached_results = [get_cached_result(cached, e.path, st) for e, st in zip(entries, stats)]
+            new_results = []  # validation results waiting to be saved to the cache
+
+            with open(output_file, 'a', newline='', buffering=write_buffer_size) as csv_file:
+                # create CSV writer object; rows arrive already ordered by header field
+                csv_writer = csv.writer(csv_file)
+                # determine whether to write header
+                if csv_file.tell() == 0:  # if file object's position is at the beginning of the file, in append mode
+                    csv_writer.writerow(get_field_names(schema))  # write header row
+                batch = []  # rows waiting to be written
+
+                file_count = len(entries)
+
+                # read, validate & build rows in parallel; logging, copying & writing stay on this process
+                with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker, initargs=(schema, k == 'users')) as executor:
+                    paths = [e.path for e in entries]
+                    batch_starts = range(0, file_count, worker_batch_size)
+                    results = chain.from_iterable(executor.map(
+                        process_files,
+                        [paths[i:i + worker_batch_size] for i in batch_starts],
+                        [cached_results[i:i + worker_batch_size] for i in batch_starts],
+                    ))
+
+                    for entry, stat, cached_result, (is_valid, message, row) in zip(entries, stats, cached_results, results):
+                        if cached_result is None:
+                            new_results.append((entry.path, stat.st_mtime_ns, stat.st_size, schema_key, is_valid, message))
+                            if len(new_results) >= cache_batch_size:
+                                save_validation_results(cache, new_results)
+                                new_results.clear()
+
+                        if not is_valid:
+                            invalid_count += 1
+                            if invalid_count == 1:  # first invalid file of this table
+                                create_dir(bad_data_dir)
+                            error = get_error_log(entry.path, message)
+                            save_log(log_file, error)  # log error to file for later inspection
+                            copy_file(entry.name, entry.path, bad_data_dir)  # copy the file to another directory for later inspection
+                        else:
+                            valid_count += 1
+
+                        if row is not None:
+                            batch.append(row)
+                            if len(batch) >= batch_size:
+                                csv_writer.writerows(batch)
+                                batch.clear()
+
+                csv_writer.writerows(batch)  # write remaining rows
+
+            save_validation_results(cache, new_results)
+
+            print(f'Total JSON data files for "{k}": {file_count}')
+            print(f'Number of files that match schema: {valid_count}')
+            print(f'Number of files with schema errors: {invalid_count}\n')
 
     time_taken = format_time(time.perf_counter() - start_time)
     print(f'Elapsed Time: {time_taken}')
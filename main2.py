@@ -4,21 +4,42 @@ import sys
 import json
 import time
 import shutil
-from datetime import datetime
-from jsonschema import validate
-from jsonschema.exceptions import ValidationError
+import hashlib
+import sqlite3
+from itertools import chain
+from contextlib import closing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, Callable
+import orjson
+import fastjsonschema
+from fastjsonschema import JsonSchemaValueException
 
 
 
 CWD = os.getcwd()  # current working directory
 replace_missing_data = True  # Whether to replace missing fields with blanks/NULLs or to discard the data
+write_buffer_size = 1 << 20  # output CSV file buffer size in bytes (1 MiB)
+log_file_name = 'errors.log'  # schema error log
+log_open_retries = 5  # attempts at opening the error log before giving up
+log_time = ''  # formatted time of the latest error log entry, see get_log_time()
+log_time_second = None  # the second `log_time` was formatted for
+validation_cache_file = '.validation_cache.sqlite'  # validation results of previous runs, to skip re-validating unchanged files
+cache_batch_size = 1000  # number of validation results to buffer before saving them to the cache
+batch_size = 1000  # number of rows to buffer before writing them to the CSV files
+read_chunk_size = 1 << 16  # bytes requested per read() call; most data files fit in one
+worker_batch_size = 64  # number of data files handed to a worker process at a time
+reader_threads = 8  # file reading threads per worker process
+validator = None  # schema validation function of the current worker process, set by init_worker()
+required_fields = None  # required fields of the current worker process's schema, set by init_worker()
+fieldnames = None  # (payload, metadata) CSV header fields of the current worker process, set by init_worker()
+is_users = False  # whether the current worker process handles "users" data, set by init_worker()
+reader = None  # file reading thread pool of the current worker process, set by init_worker()
 
 data = {
     "users": {
         "schema_file": "user-events-schema.json",
         "data_dir": "users",
         "payload_file": "users.csv",
-        "metadata_file": "metadata.csv",
         "schema_mismatch_dir": "users_schema_mismatches",
     },
 
@@ -26,10 +47,10 @@ data = {
         "schema_file": "card-events-schema.json",
         "data_dir": "cards",
         "payload_file": "cards.csv",
-        "metadata_file": "metadata.csv",
         "schema_mismatch_dir": "cards_schema_mismatches",
     }
 }
+metadata_file = "metadata.csv"  # metadata of all tables
 
 
 def create_dir(dir_name: str) -> None:
@@ -61,47 +82,65 @@ def copy_file(fn: str, src: str, dst_dir: str) -> None:
     Returns:
     None
 
-    If the destination directory does not exist, it will be created before
-    copying the file. The function uses the current working directory (CWD)
-    as the base path for constructing the full destination path.
+    The destination directory must already exist. The file is hard linked
+    where possible and copied (without its permissions) otherwise, e.g.
+    across file systems. The function uses the current working directory
+    (CWD) as the base path for constructing the full destination path.
     """
-    if not os.path.isdir(dst_dir):
-        create_dir(dst_dir)
     dst = os.path.join(CWD, dst_dir, fn)
-    shutil.copy(src, dst)
+    try:
+        os.link(src, dst)  # hard link, no data is copied
+    except FileExistsError:  # copied on a previous run
+        if not os.path.samefile(src, dst):
+            shutil.copyfile(src, dst)
+    except OSError:  # e.g. destination is on another file system
+        shutil.copyfile(src, dst)
 
 
-def save_log(file_name: str, content: str) -> None:
+def open_log(file_name: str) -> BinaryIO:
     """
-    Save log content to a file.
+    Open a log file for appending.
 
     Parameters:
-    - file_name (str): The name of the file to save the log to.
-    - content (str): The log content to be saved.
+    - file_name (str): The name of the log file.
 
     Returns:
-    None
+    BinaryIO: The log file, opened in binary 'append' mode.
 
-    This function attempts to open the specified file in 'append' mode
-    and writes the log content to it. If an IOError or PermissionError
-    occurs, the function continues trying until it is successful.
+    If an OSError (e.g. a PermissionError while another process holds the
+    file) occurs, the function retries with a growing delay, up to
+    `log_open_retries` attempts, before re-raising the error.
     """
-    while True:
+    for attempt in range(1, log_open_retries + 1):
         try:
-            with open(file_name, "a", encoding="utf-8") as output_file:
-                output_file.write(content + "\n")
-                break
-        except (IOError, PermissionError) as error:
-            continue
+            return open(file_name, 'ab')
+        except OSError:
+            if attempt == log_open_retries:
+                raise
+            time.sleep(0.01 * attempt)
+
+
+def save_log(log_file: BinaryIO, content: str) -> None:
+    """
+    Save log content to a log file.
+
+    Parameters:
+    - log_file (BinaryIO): The log file, see open_log().
+    - content (str): The log content to be saved.
+
+    Returns:
+    None
+    """
+    log_file.write(f'{content}\n'.encode('utf-8'))
 
 
-def validate_json(json_data: dict, schema: dict) -> tuple[bool, str]:
+def validate_json(json_data: dict, validator: Callable[[dict], dict]) -> tuple[bool, str]:
     """
     Validate JSON data against a JSON schema.
 
     Parameters:
     - json_data (dict): The JSON data to be validated.
-    - schema (dict): The JSON schema used for validation.
+    - validator (Callable[[dict], dict]): The validation function compiled from the JSON schema.
 
     Returns:
     tuple[bool, str]: A tuple containing a boolean indicating
@@ -110,13 +149,77 @@ def validate_json(json_data: dict, schema: dict) -> tuple[bool, str]:
     If validation fails, the boolean is False, and the message
     contains details about the validation error.
     """
-    try:  
-        validate(instance=json_data, schema=schema)
+    try:
+        validator(json_data)
         return True, 'success'
-    except ValidationError as e:
+    except JsonSchemaValueException as e:
+        if e.rule == 'required':  # report missing fields the way jsonschema did, so they can still be told apart
+            missing = next(k for k in e.rule_definition if k not in e.value)
+            return False, f'{missing!r} is a required property'
+        if e.rule == 'type':  # likewise for type errors, so the error log reads the same
+            types = e.rule_definition if isinstance(e.rule_definition, list) else [e.rule_definition]
+            return False, f"{e.value!r} is not of type {', '.join(repr(t) for t in types)}"
         return False, e.message
 
 
+def get_required_fields(schema: dict) -> tuple[tuple, tuple]:
+    """
+    Retrieve the required fields from a JSON schema.
+
+    Parameters:
+    - schema (dict): The JSON schema.
+
+    Returns:
+    tuple[tuple, tuple]: The required top-level fields, and a
+    (section, required fields) pair for each section (payload & metadata),
+    in schema order. See find_shallow_error().
+    """
+    properties = schema['properties']
+    return (
+        tuple(schema['required']),
+        tuple((section, tuple(properties[section]['required'])) for section in properties),
+    )
+
+
+def find_shallow_error(json_data: dict, required_fields: tuple[tuple, tuple]) -> str | None:
+    """
+    Find a schema error near the top of JSON data.
+
+    Parameters:
+    - json_data (dict): The JSON data to be checked.
+    - required_fields (tuple[tuple, tuple]): The required fields,
+      see get_required_fields().
+
+    Returns:
+    str | None: The error message, or None if no such error is found.
+
+    A quick check, done before full validation, for missing fields and
+    sections that aren't objects. Like jsonschema's best match, these
+    errors are reported ahead of any error in a section's fields; a
+    section that isn't an object ahead of missing fields; and otherwise
+    in schema order. Other errors are left to the validator.
+    """
+    if not isinstance(json_data, dict):  # leave type errors to the validator
+        return None
+
+    top_level_fields, sections = required_fields
+    for field in top_level_fields:
+        if field not in json_data:
+            return f'{field!r} is a required property'
+
+    # like jsonschema, a section of the wrong type outranks missing fields in other sections
+    for section, fields in sections:
+        if not isinstance(json_data[section], dict):  # payload & metadata are objects in every schema
+            return f"{json_data[section]!r} is not of type 'object'"
+
+    for section, fields in sections:
+        for field in fields:
+            if field not in json_data[section]:
+                return f'{field!r} is a required property'
+
+    return None
+
+
 def format_time(seconds: float) -> str:
     """
     Format time in seconds into a human-readable string.
@@ -158,12 +261,11 @@ def get_field_names(schema: dict) -> tuple[list, list]:
     - The second list represents metadata fields for the CSV header.
     """
     # retrieve fields for CSV header from JSON schema
-    schema_copy = schema.copy()  # copy dict to prevent modification of referenced dict argument
-    payload_fields = []
+    payload_fields = []  # new lists, so the schema's own lists aren't modified below
     metadata_fields = []
 
-    payload_fields.extend(schema_copy['properties']['payload']['required'])
-    metadata_fields.extend(schema_copy['properties']['metadata']['required'])
+    payload_fields.extend(schema['properties']['payload']['required'])
+    metadata_fields.extend(schema['properties']['metadata']['required'])
 
     payload_fields.append('event_id')  # payload foreign key
 
@@ -194,68 +296,90 @@ def fix_job_field(job: str) -> str:
     Returns:
     str: The modified job title with consistent formatting.
     """
-    general_job_title, specialization = job.split(',')
+    comma_index = job.find(',')
+    general_job_title = job[:comma_index]
+    specialization = job[comma_index + 1:].lstrip()  # strip whitespace from specialization
 
-    specialization = specialization.lstrip()  # strip whitespace from specialization
     new_job_title = f'{specialization} {general_job_title}'.capitalize()  # create new title & capitalize
 
     return new_job_title
 
 
-def get_row_data(json_data: dict) -> tuple[dict, dict]:
+def get_row_data(json_data: dict, pf: list, mf: list, is_users: bool) -> tuple[tuple, tuple]:
     """
     Retrieve data for a CSV row from JSON data.
 
     Parameters:
     - json_data (dict): The JSON data.
+    - pf (list): The payload fields for the CSV header.
+    - mf (list): The metadata fields for the CSV header.
+    - is_users (bool): Whether the JSON data is "users" data.
 
     Returns:
-    tuple[dict, dict]: A tuple containing two dictionaries:
-    - The first dictionary represents payload data for the CSV row.
-    - The second dictionary represents metadata for the CSV row.
+    tuple[tuple, tuple]: A tuple containing two tuples, ordered by the
+    header fields (missing fields are left blank):
+    - The first tuple represents payload data for the CSV row.
+    - The second tuple represents metadata for the CSV row.
     """
-    
-    json_data_copy = json_data.copy()
-    payload_dict = dict()
-    metadata_dict = dict()
+    payload = json_data['payload']
+    metadata = json_data['metadata']
 
-    payload_dict.update(json_data_copy['payload'])
-    metadata_dict.update(json_data_copy['metadata'])
-
-    # add 'event_id' field to payload_dict
-    payload_dict['event_id'] = metadata_dict.get('event_id', '')  # return event_id's value or empty string
+    # payload values that don't come straight from the JSON payload
+    fixed = dict()
+    fixed['event_id'] = metadata.get('event_id', '')  # payload foreign key; return event_id's value or empty string
 
     # adhoc data fix for "users"
-    if 'address' in payload_dict.keys():  # check if is "users" data to prevent unnecessary overhead for "cards" data
-        payload_dict['address'] = payload_dict['address'].replace('\n', ' ')  # strip '\n' (newline character) from address field
-        if ',' in payload_dict['job']:  # check if is affected data
-            payload_dict['job'] = fix_job_field(payload_dict['job'])
+    if is_users:  # skip for "cards" data to prevent unnecessary overhead
+        # fields may be missing, or of the wrong type, in invalid data
+        address = payload.get('address')
+        if isinstance(address, str):
+            fixed['address'] = address.replace('\n', ' ')  # strip '\n' (newline character) from address field
+        job = payload.get('job')
+        if isinstance(job, str) and ',' in job:  # check if is affected data
+            fixed['job'] = fix_job_field(job)
 
     # adhoc name & created_by_name normalization
-    pdk = payload_dict.keys()
-    if 'name' in pdk:
-        fn = 'name'
-        name_split = payload_dict['name'].split(' ')
-    elif 'created_by_name' in pdk:
-        fn = 'created_by_name'
-        name_split = payload_dict['created_by_name'].split(' ')
+    fn = 'name' if is_users else 'created_by_name'
+    name = payload.get(fn)
+    name_split = name.split(' ') if isinstance(name, str) else []
     split_len = len(name_split)
     if split_len in [3, 4]:
         titles = ['Dr.', 'Mr.', 'Mrs.', 'Ms.']
         suffixes = ['PhD', 'MD', 'DDS', 'DVM', 'IV', 'Jr.', 'II']
         if split_len == 4:
-            payload_dict['prefix'] = name_split[0]
-            payload_dict['suffix'] = name_split[3]
-            payload_dict[fn] = f'{name_split[1]} {name_split[2]}'
+            fixed['prefix'] = name_split[0]
+            fixed['suffix'] = name_split[3]
+            fixed[fn] = f'{name_split[1]} {name_split[2]}'
         else:
             if name_split[0] in titles:
-                payload_dict['prefix'] = name_split[0]
-                payload_dict[fn] = f'{name_split[1]} {name_split[2]}'
+                fixed['prefix'] = name_split[0]
+                fixed[fn] = f'{name_split[1]} {name_split[2]}'
             else:
-                payload_dict['suffix'] = name_split[2]
-                payload_dict[fn] = f'{name_split[0]} {name_split[1]}'
+                fixed['suffix'] = name_split[2]
+                fixed[fn] = f'{name_split[0]} {name_split[1]}'
+
+    p_row = tuple(fixed[f] if f in fixed else payload.get(f, '') for f in pf)
+    m_row = tuple(metadata.get(f, '') for f in mf)
 
-    return payload_dict, metadata_dict
+    return p_row, m_row
+
+
+def get_log_time() -> str:
+    """
+    Get the current time for an error log entry.
+
+    Returns:
+    str: The formatted current time.
+
+    Timestamps only show whole seconds, so the time is formatted at most
+    once per second and reused in between.
+    """
+    global log_time, log_time_second
+    now = int(time.time())
+    if now != log_time_second:
+        log_time = time.strftime("%d/%m/%Y %I:%M:%S %p", time.localtime(now))
+        log_time_second = now
+    return log_time
 
 
 def get_error_log(file_name: str, err_message: str) -> str:
@@ -269,87 +393,328 @@ def get_error_log(file_name: str, err_message: str) -> str:
     Returns:
     str: A formatted error log entry string.
     """
-    time_ = datetime.now().strftime("%d/%m/%Y %I:%M:%S %p")
+    time_ = get_log_time()
     error = f'{time_}, ERROR, SCHEMA ERR, {file_name}, {err_message}'
     return error
 
 
-def main() -> None:
-    print('Running...')
-    start_time = time.perf_counter()
+def open_validation_cache(cache_file: str) -> sqlite3.Connection:
+    """
+    Open the validation cache database, creating its table if needed.
+
+    Parameters:
+    - cache_file (str): The path of the SQLite database file.
+
+    Returns:
+    sqlite3.Connection: The open cache database connection.
+    """
+    cache = sqlite3.connect(cache_file)
+    cache.execute(
+        'CREATE TABLE IF NOT EXISTS validation ('
+        'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, schema_key TEXT, is_valid INTEGER, message TEXT)'
+    )
+    return cache
+
+
+def get_schema_key(schema: dict) -> str:
+    """
+    Compute the cache key of a JSON schema.
+
+    Parameters:
+    - schema (dict): The JSON schema.
+
+    Returns:
+    str: A hash of the schema's canonical JSON form. Changing the schema
+    changes the key, invalidating previously cached results.
+    """
+    return hashlib.blake2b(orjson.dumps(schema, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def load_validation_cache(cache: sqlite3.Connection, schema_key: str) -> dict:
+    """
+    Load the cached validation results for a schema.
+
+    Parameters:
+    - cache (sqlite3.Connection): The cache database connection.
+    - schema_key (str): The cache key of the schema, see get_schema_key().
+
+    Returns:
+    dict: A mapping of file path to its (mtime_ns, size, is_valid, message) record.
+    """
+    rows = cache.execute('SELECT path, mtime_ns, size, is_valid, message FROM validation WHERE schema_key = ?', (schema_key,))
+    return {path: record for path, *record in rows}
+
+
+def get_cached_result(cached: dict, path: str, stat: os.stat_result) -> tuple[bool, str] | None:
+    """
+    Look up the cached validation result of a data file.
+
+    Parameters:
+    - cached (dict): The cached records, see load_validation_cache().
+    - path (str): The path of the data file.
+    - stat (os.stat_result): The data file's status, taken before it is read.
+
+    Returns:
+    tuple[bool, str] | None: The cached validation result and message,
+    or None if the file is not cached or has changed since.
+    """
+    record = cached.get(path)
+    if record is None:
+        return None
+    mtime_ns, size, is_valid, message = record
+    if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+        return None
+    return bool(is_valid), message
+
+
+def save_validation_results(cache: sqlite3.Connection, records: list) -> None:
+    """
+    Save validation results to the cache.
+
+    Parameters:
+    - cache (sqlite3.Connection): The cache database connection.
+    - records (list): (path, mtime_ns, size, schema_key, is_valid, message) records.
+
+    Returns:
+    None
+    """
+    cache.executemany('INSERT OR REPLACE INTO validation VALUES (?, ?, ?, ?, ?, ?)', records)
+    cache.commit()
+
+
+def init_worker(schema: dict, users_data: bool) -> None:
+    """
+    Prepare a worker process for validating data files.
+
+    Parameters:
+    - schema (dict): The JSON schema used for validation.
+    - users_data (bool): Whether the data files are "users" data.
 
-    for k, v in data.items():
-        print(f'\nProcessing {k} data...')
-        payload_file = v['payload_file']
-        metadata_file = v['metadata_file']
-        schema_file = v['schema_file']
-        data_dir = v['data_dir']
-        bad_data_dir = os.path.join(CWD, v['schema_mismatch_dir'])
+    Returns:
+    None
+
+    Compiled validators can't be pickled, so each worker process compiles
+    the schema once into the module-level `validator`, alongside its
+    `required_fields`. Formats (date-time, uuid) are not asserted,
+    matching the previous jsonschema behaviour. The worker also keeps
+    the CSV header `fieldnames` & `is_users` for building rows, and starts
+    its `reader` thread pool for reading data files.
+    """
+    global validator, required_fields, fieldnames, is_users, reader
+    validator = fastjsonschema.compile(schema, use_formats=False)
+    required_fields = get_required_fields(schema)
+    fieldnames = get_field_names(schema)
+    is_users = users_data
+    reader = ThreadPoolExecutor(max_workers=reader_threads)  # file reads release the GIL
+
+
+def read_file(file_path: str) -> bytes:
+    """
+    Read the contents of a file.
+
+    Parameters:
+    - file_path (str): The path of the file.
+
+    Returns:
+    bytes: The file contents.
+
+    Uses raw os-level reads, skipping the fstat/ioctl/lseek calls a
+    buffered file object makes when opened; data files are small, so
+    these would otherwise outnumber the reads themselves.
+    """
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        chunks = []
+        while chunk := os.read(fd, read_chunk_size):
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return b''.join(chunks)
+
+
+def keep_row(is_valid: bool, message: str) -> bool:
+    """
+    Decide whether a data file's data is written to the CSV files.
 
+    Parameters:
+    - is_valid (bool): Whether the file matches the schema.
+    - message (str): The validation message.
 
-        file_count = 0  # total JSON data files
-        valid_count = 0  # files that match the schema spec
-        invalid_count = 0  # files that don't match the schema spec
+    Returns:
+    bool: True for valid data, and for data with missing fields if
+    `replace_missing_data` is set; False otherwise.
+    """
+    if is_valid:
+        return True
 
-        data_path = os.path.join(CWD, data_dir)
-        _, _, file_names = next(os.walk(data_path))
+    if 'is a required property' not in message:  # if error is anything other than missing field/property
+        return False
 
-        with open(schema_file, 'r') as schema_s:
-            schema = json.load(schema_s)
+    return replace_missing_data  # replace missing fields or discard invalid data
 
-        with open(payload_file, 'a', newline='') as p_file:
-            pf, mf = get_field_names(schema)
 
-            # create payload CSV writer object
-            p_writer = csv.DictWriter(p_file, fieldnames=pf, restval='', extrasaction='ignore')
+def process_file(pending_read: Future | None, cached_result: tuple[bool, str] | None) -> tuple[bool, str, tuple[tuple, tuple] | None]:
+    """
+    Validate and build the CSV rows for a single JSON data file.
 
-            # determine whether to write metadata header
-            if p_file.tell() == 0:  # if file object's position is at the beginning of the file, in append mode
-                p_writer.writeheader()  # write header row
+    Parameters:
+    - pending_read (Future | None): The file's read on the reader threads,
+      or None if the file isn't needed.
+    - cached_result (tuple[bool, str] | None): The file's cached validation
+      result, or None if it has to be validated.
 
-            # create metadata CSV writer object
-            with open(metadata_file, 'a', newline='') as m_file:  # use context manager, to keep file stream open for the duration of data writing
-                m_writer = csv.DictWriter(m_file, fieldnames=mf, restval='', extrasaction='ignore')
+    Returns:
+    tuple[bool, str, tuple[tuple, tuple] | None]: A tuple containing the
+    validation result, the validation message and the payload & metadata
+    rows, or None if the data is to be discarded.
+    """
+    if cached_result is None:
+        json_data = orjson.loads(pending_read.result())  # orjson parses bytes directly, no text decoding needed
+        error = find_shallow_error(json_data, required_fields)
+        if error is not None:  # no need for full validation
+            is_valid, message = False, error
+        else:
+            is_valid, message = validate_json(json_data=json_data, validator=validator)
+    else:  # file is unchanged since it was last validated
+        json_data = None
+        is_valid, message = cached_result
 
-                if m_file.tell() == 0:
-                    m_writer.writeheader()
+    if not keep_row(is_valid, message):
+        return is_valid, message, None
 
-                for file_name in file_names:
-                    if file_name.endswith('.json'):  # parse JSON files only
-                        file_count += 1  # increment JSON file count
-                    else:
-                        continue
+    if json_data is None:  # only read for its row data
+        json_data = orjson.loads(pending_read.result())
 
-                    json_file_path = os.path.join(data_path, file_name)
+    return is_valid, message, get_row_data(json_data, *fieldnames, is_users)
 
-                    with open(json_file_path, 'r') as json_file:
-                        json_data = json.load(json_file)
 
-                    is_valid, message = validate_json(json_data=json_data, schema=schema)
+def process_files(json_file_paths: list, cached_results: list) -> list:
+    """
+    Read, validate and build the CSV rows for a batch of JSON data files.
 
-                    if not is_valid:
+    Parameters:
+    - json_file_paths (list): The paths of the JSON data files.
+    - cached_results (list): The files' cached validation results, see
+      process_file().
 
-                        invalid_count += 1
-                        error = get_error_log(json_file_path, message)
-                        save_log('errors.log', error)  # log error to file for later inspection
-                        copy_file(file_name, json_file_path, bad_data_dir)  # copy the file to another directory for later inspection
+    Returns:
+    list: The process_file() result of each file, in order.
 
-                        if 'is a required property' not in message:  # if error is anything other than missing field/property
-                            continue  # continue to next data
+    Runs in a worker process; see init_worker(). The batch's reads are
+    queued up front on the reader threads, so later files are read while
+    earlier ones are parsed and validated. Files that are discarded
+    based on their cached result are not read.
+    """
+    pending_reads = [
+        reader.submit(read_file, json_file_path) if cached_result is None or keep_row(*cached_result) else None
+        for json_file_path, cached_result in zip(json_file_paths, cached_results)
+    ]
+    return [process_file(*args) for args in zip(pending_reads, cached_results)]
 
-                        if not replace_missing_data:  # discard invalid data
-                            continue  # continue to next data
-                    else:
-                        valid_count += 1
 
-                    p_row_data, m_row_data = get_row_data(json_data)
-                    # print(row_dict)
-                    p_writer.writerow(p_row_data)
-                    m_writer.writerow(m_row_data)
+def main() -> None:
+    print('Running...')
+    start_time = time.perf_counter()
 
-        print(f'Total JSON data files for "{k}": {file_count}')
-        print(f'Number of files that match schema: {valid_count}')
-        print(f'Number of files with schema errors: {invalid_count}\n')
+    # keep the cache, error log & shared metadata file open for the whole run; closed even if a table fails
+    with (
+        closing(open_validation_cache(validation_cache_file)) as cache,
+        open_log(log_file_name) as log_file,
+        open(metadata_file, 'a', newline='', buffering=write_buffer_size) as m_file,
+    ):
+        for k, v in data.items():
+            print(f'\nProcessing {k} data...')
+            payload_file = v['payload_file']
+            schema_file = v['schema_file']
+            data_dir = v['data_dir']
+            bad_data_dir = os.path.join(CWD, v['schema_mismatch_dir'])
+
+
+            valid_count = 0  # files that match the schema spec
+            invalid_count = 0  # files that don't match the schema spec
+
+            data_path = os.path.join(CWD, data_dir)
+            with os.scandir(data_path) as it:  # parse JSON files only
+                entries = [e for e in it if e.is_file() and e.name.endswith('.json')]
+            # taken before any file is read, so a cached result always matches the data it was validated on
+            stats = [e.stat() for e in entries]
+
+            with open(schema_file, 'r') as schema_s:
+                schema = json.load(schema_s)
+
+            # look up files validated against this schema on a previous run
+            schema_key = get_schema_key(schema)
+            cached = load_validation_cache(cache, schema_key)
+            cached_results = [get_cached_result(cached, e.path, st) for e, st in zip(entries, stats)]
+            new_results = []  # validation results waiting to be saved to the cache
+
+            with open(payload_file, 'a', newline='', buffering=write_buffer_size) as p_file:
+                pf, mf = get_field_names(schema)
+
+                # create payload CSV writer object; rows arrive already ordered by header field
+                p_writer = csv.writer(p_file)
+
+                # determine whether to write payload header
+                if p_file.tell() == 0:  # if file object's position is at the beginning of the file, in append mode
+                    p_writer.writerow(pf)  # write header row
+
+                # create metadata CSV writer object
+                m_writer = csv.writer(m_file)
+
+                if m_file.tell() == 0:  # only for the first table of a new file
+                    m_writer.writerow(mf)
+
+                p_batch = []  # rows waiting to be written
+                m_batch = []
+
+                file_count = len(entries)
+
+                # read, validate & build rows in parallel; logging, copying & writing stay on this process
+                with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker, initargs=(schema, k == 'users')) as executor:
+                    paths = [e.path for e in entries]
+                    batch_starts = range(0, file_count, worker_batch_size)
+                    results = chain.from_iterable(executor.map(
+                        process_files,
+                        [paths[i:i + worker_batch_size] for i in batch_starts],
+                        [cached_results[i:i + worker_batch_size] for i in batch_starts],
+                    ))
+
+                    for entry, stat, cached_result, (is_valid, message, rows) in zip(entries, stats, cached_results, results):
+                        if cached_result is None:
+                            new_results.append((entry.path, stat.st_mtime_ns, stat.st_size, schema_key, is_valid, message))
+                            if len(new_results) >= cache_batch_size:
+                                save_validation_results(cache, new_results)
+                                new_results.clear()
+
+                        if not is_valid:
+                            invalid_count += 1
+                            if invalid_count == 1:  # first invalid file of this table
+                                create_dir(bad_data_dir)
+                            error = get_error_log(entry.path, message)
+                            save_log(log_file, error)  # log error to file for later inspection
+                            copy_file(entry.name, entry.path, bad_data_dir)  # copy the file to another directory for later inspection
+                        else:
+                            valid_count += 1
+
+                        if rows is not None:
+                            p_row_data, m_row_data = rows
+                            p_batch.append(p_row_data)
+                            m_batch.append(m_row_data)
+                            if len(p_batch) >= batch_size:
+                                p_writer.writerows(p_batch)
+                                m_writer.writerows(m_batch)
+                                p_batch.clear()
+                                m_batch.clear()
+
+                # write remaining rows
+                p_writer.writerows(p_batch)
+                m_writer.writerows(m_batch)
+
+            save_validation_results(cache, new_results)
+
+            print(f'Total JSON data files for "{k}": {file_count}')
+            print(f'Number of files that match schema: {valid_count}')
+            print(f'Number of files with schema errors: {invalid_count}\n')
 
     time_taken = format_time(time.perf_counter() - start_time)
     print(f'Elapsed Time: {time_taken}')